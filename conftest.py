@@ -0,0 +1 @@
+# Keeps the repo root importable (`import main`) when running plain `pytest`.
@@ -1,27 +1,57 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone, timedelta
-import random
-
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+import gzip
+import hashlib
+import time
+from functools import lru_cache
+from typing import Any, Callable, TypeVar
+
+import brotli
+import numpy as np
+import orjson
+from fastapi import FastAPI, Request, Response
+from fastapi.exception_handlers import http_exception_handler, request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
 from pydantic import BaseModel
+from starlette.exceptions import HTTPException as StarletteHTTPException
 
 
-app = FastAPI(title="APM Demo API", version="1.0.0")
+T = TypeVar("T")
 
-# Vercel entrypoint: export `app` at module scope.
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+
+
+def encode(content: Any) -> bytes:
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
 
 
-# Demo-only CORS so the static HTML can call the API from anywhere.
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=False,
-    allow_methods=["*"],
-    allow_headers=["*"],
+class APIResponse(ORJSONResponse):
+    # orjson formats datetimes natively, so handlers hand over `datetime` objects as-is
+    def render(self, content: Any) -> bytes:
+        return encode(content)
+
+
+app = FastAPI(
+    title="APM Demo API",
+    version="1.0.0",
+    default_response_class=APIResponse,
 )
 
+# Vercel entrypoint: export `app` at module scope.
+
+
+# Demo-only CORS so the static HTML can call the API from anywhere. With any origin
+# and no credentials the headers never vary, so responses carry them pre-baked
+# instead of paying for CORSMiddleware on every request.
+_CORS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "*",
+    "Access-Control-Allow-Headers": "*",
+}
+
 # -----------------------------
 # Simulated JSON "stores"
 # (in-memory; frontend stores additions in localStorage)
@@ -69,6 +99,11 @@ BASE_SERVICES = [
     },
 ]
 
+# The service list never changes, so encode it once and splice only `ts` in per request.
+_SERVICES_BLOB = orjson.dumps(BASE_SERVICES)[1:-1]
+# weak: the body's `ts` differs per request, only the service list is stable
+_SERVICES_ETAG = 'W/"%s"' % hashlib.md5(_SERVICES_BLOB, usedforsecurity=False).hexdigest()
+
 SECURITY_EVENTS = [
     {"id": "evt-1", "severity": "high", "title": "Suspicious login burst", "detail": "Multiple failed logins from new ASN"},
     {"id": "evt-2", "severity": "medium", "title": "WAF rule triggered", "detail": "Possible SQLi pattern blocked"},
@@ -76,17 +111,26 @@ SECURITY_EVENTS = [
     {"id": "evt-4", "severity": "info", "title": "Key rotation reminder", "detail": "KMS key rotation due in 7 days"},
 ]
 
+SEV_RANK = {"info": 0, "medium": 1, "high": 2, "critical": 3}
+# (id, severity, title, detail, rank) rows, so the hot path builds event dicts positionally
+_SECURITY_ROWS = tuple(
+    (ev["id"], ev["severity"], ev["title"], ev["detail"], SEV_RANK.get(ev["severity"], 0))
+    for ev in SECURITY_EVENTS
+)
+
 
 # -----------------------------
 # Models
 # -----------------------------
+# Documentation only: handlers build their payloads directly, so these are passed
+# via `responses=` and never used to validate what we send.
 class ServicesResponse(BaseModel):
-    ts: str
+    ts: datetime
     services: list[dict]
 
 
 class ServiceMetrics(BaseModel):
-    ts: str
+    ts: datetime
     latency_ms: float
     error_rate: float
     rps: float
@@ -96,136 +140,192 @@ class ServiceMetrics(BaseModel):
 # -----------------------------
 # Helpers
 # -----------------------------
-def iso_now() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def precompress(body: bytes) -> dict[str, bytes]:
+    # Encoded bodies keyed by Content-Encoding ("" is identity). Tiny payloads can
+    # grow when compressed, so only keep the variants that actually save bytes.
+    variants = {"": body}
+    for coding, blob in (("br", brotli.compress(body, quality=5)), ("gzip", gzip.compress(body, mtime=0))):
+        if len(blob) < len(body):
+            variants[coding] = blob
+    return variants
+
+
+def encoding_qualities(accept_encoding: str | None) -> dict[str, float]:
+    # Accept-Encoding as {coding: q}; q=0 means refused, entries with a bad q are skipped
+    qualities: dict[str, float] = {}
+    if not accept_encoding:
+        return qualities
+    for part in accept_encoding.split(","):
+        coding, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = -1.0
+        if q >= 0:
+            qualities[coding.strip().lower()] = q
+    return qualities
+
+
+def encoded_response(variants: dict[str, bytes], request: Request) -> Response:
+    # Pick the pre-compressed body with the client's highest q; on a tie br beats
+    # gzip. An explicit entry (including q=0) overrides `*`. Nothing is compressed here.
+    headers = {**_CORS, "Vary": "Accept-Encoding"}
+    qualities = encoding_qualities(request.headers.get("accept-encoding"))
+    best, best_q = "", 0.0
+    for coding in ("br", "gzip"):
+        q = qualities.get(coding, qualities.get("*", 0.0))
+        if coding in variants and q > best_q:
+            best, best_q = coding, q
+    if best:
+        headers["Content-Encoding"] = best
+    return Response(content=variants[best], media_type="application/json", headers=headers)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match uses weak comparison and may list several tags
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag.removeprefix("W/"):
+            return True
+    return False
 
 
-def pick_status(score: float) -> str:
-    # score in [0..1+] where higher is worse
-    if score > 0.85:
-        return "down"
-    if score > 0.55:
-        return "warn"
-    return "ok"
+def stable_seed(service_id: str) -> int:
+    # keeps each service "personality" stable across refreshes (and processes,
+    # unlike the salted built-in hash())
+    return int.from_bytes(hashlib.blake2s(service_id.encode(), digest_size=8).digest(), "big")
 
 
-def clamp(v: float, lo: float, hi: float) -> float:
-    return max(lo, min(hi, v))
+def bucket_cached(period: int, build: Callable[[datetime], T]) -> Callable[[], T]:
+    # Simulators are seeded by `timestamp // period`, so their output only changes
+    # once per bucket; build it on the first request and reuse it after that. `ts`
+    # is the bucket start, so the cached bytes don't depend on which request filled
+    # the slot. Buckets only move forward, so one slot is all the cache ever needs.
+    entry: tuple[int | None, Any] = (None, None)
 
+    def cached() -> T:
+        nonlocal entry
+        bucket = int(time.time()) // period
+        if entry[0] != bucket:
+            # single assignment so concurrent readers never see a mismatched pair
+            entry = (bucket, build(datetime.fromtimestamp(bucket * period, timezone.utc)))
+        return entry[1]
 
-def stable_seed(service_id: str) -> int:
-    # keeps each service "personality" stable across refreshes
-    return abs(hash(service_id)) % (2**31 - 1)
+    return cached
 
 
-def simulate_service_metrics(service_id: str) -> dict:
+def simulate_service_metrics(service_id: str, now: datetime) -> dict:
     # Stable base + time drift for demo (new value every 5 seconds)
-    rng = random.Random(stable_seed(service_id) + int(datetime.now(timezone.utc).timestamp() // 5))
-    base_latency = rng.uniform(20, 260)
-    base_error = rng.uniform(0.0, 2.5)
-    base_rps = rng.uniform(5, 250)
+    rng = np.random.default_rng((stable_seed(service_id), int(now.timestamp() // 5)))
+    u = rng.random(6)
+    # base latency, error rate, rps
+    raw = u[:3] * (240, 2.5, 245) + (20, 0.0, 5)
 
     # occasional spikes
-    if rng.random() < 0.08:
-        base_latency *= rng.uniform(2.0, 4.0)
-        base_error *= rng.uniform(2.0, 6.0)
+    if u[3] < 0.08:
+        raw[:2] *= u[4:] * (2.0, 4.0) + 2.0
 
-    latency = clamp(base_latency, 5, 2000)
-    error = clamp(base_error, 0.0, 25.0)
-    rps = clamp(base_rps, 0.1, 2000)
+    latency, error, rps = np.clip(raw, (5, 0.0, 0.1), (2000, 25.0, 2000), out=raw).tolist()
 
-    # status heuristic
-    score = clamp((latency / 900.0) * 0.6 + (error / 10.0) * 0.4, 0.0, 1.2)
-    status = pick_status(score)
+    # status heuristic: score >= 0 where higher is worse; > 0.55 warns, > 0.85 is down
+    score = (latency / 900.0) * 0.6 + (error / 10.0) * 0.4
+    status = ("ok", "warn", "down")[(score > 0.55) + (score > 0.85)]
 
     return {
-        "ts": iso_now(),
-        "latency_ms": float(latency),
-        "error_rate": float(error),
-        "rps": float(rps),
+        "ts": now,
+        "latency_ms": latency,
+        "error_rate": error,
+        "rps": rps,
         "status": status,
     }
 
 
-def simulate_system() -> dict:
-    rng = random.Random(int(datetime.now(timezone.utc).timestamp() // 3))
-    cpu = clamp(rng.uniform(18, 92) + (10 if rng.random() < 0.12 else 0), 1, 100)
-    mem = clamp(rng.uniform(30, 88), 1, 100)
-    disk = clamp(rng.uniform(40, 93), 1, 100)
-    uptime_hours = int(rng.uniform(12, 240))
+# Domain metrics as one structure-of-arrays: rows are system (cpu, mem, disk),
+# app (p95, rps, err) and network (rtt, loss, dns). A spike fires when its
+# uniform falls under _SPIKE_P and turns the value into `value * mul + add`.
+_METRIC_LO = np.array([(18, 30, 40), (90, 20, 0.05), (12, 0.0, 8)])
+_METRIC_SPAN = np.array([(74, 58, 53), (760, 500, 3.45), (168, 1.2, 82)])
+_SPIKE_P = np.array([(0.12, 0.0, 0.0), (0.06, 0.0, 0.05), (0.05, 0.03, 0.05)])
+_SPIKE_MUL = np.array([(1.0, 1.0, 1.0), (3.2, 1.0, 4.0), (3.0, 5.0, 2.6)])
+_SPIKE_ADD = np.array([(10, 0, 0), (0, 0, 0), (0, 0, 0)])
+_METRIC_MIN = np.array([(1, 1, 1), (10, 1, 0), (1, 0, 1)])
+_METRIC_MAX = np.array([(100, 100, 100), (3000, 5000, 30), (2000, 30, 1200)])
+
+
+def simulate_domains(now: datetime) -> dict[str, dict]:
+    # system, app, network and cloud share one 3-second bucket and one draw
+    rng = np.random.default_rng(int(now.timestamp() // 3))
+    draws = rng.random((4, 8))
+
+    u = draws[:3]
+    raw = _METRIC_LO + u[:, :3] * _METRIC_SPAN
+    raw = np.where(u[:, 3:6] < _SPIKE_P, raw * _SPIKE_MUL + _SPIKE_ADD, raw)
+    np.clip(raw, _METRIC_MIN, _METRIC_MAX, out=raw)
+    (cpu, mem, disk), (p95, rps, err), (rtt, loss, dns) = raw.tolist()
+
     status = "ok"
     if cpu > 90 or mem > 90 or disk > 92:
         status = "warn"
     if cpu > 96 or mem > 96:
         status = "down"
-    return {
-        "ts": iso_now(),
+    system = {
+        "ts": now,
         "cpu_percent": cpu,
         "mem_percent": mem,
         "disk_percent": disk,
-        "uptime_human": f"{uptime_hours}h",
+        "uptime_human": f"{int(12 + u[0, 6] * 228)}h",
         "status": status,
     }
 
-
-def simulate_app() -> dict:
-    rng = random.Random(int(datetime.now(timezone.utc).timestamp() // 3) + 991)
-    p95 = clamp(rng.uniform(90, 850) * (3.2 if rng.random() < 0.06 else 1.0), 10, 3000)
-    rps = clamp(rng.uniform(20, 520), 1, 5000)
-    err = clamp(rng.uniform(0.05, 3.5) * (4.0 if rng.random() < 0.05 else 1.0), 0, 30)
     status = "ok"
     if p95 > 900 or err > 3.5:
         status = "warn"
     if p95 > 1400 or err > 8:
         status = "down"
-    return {
-        "ts": iso_now(),
+    app_status = {
+        "ts": now,
         "p95_latency_ms": p95,
         "rps": rps,
         "error_rate_percent": err,
-        "version": f"v1.{rng.randint(2,9)}.{rng.randint(0,30)}",
+        "version": f"v1.{2 + int(u[1, 6] * 8)}.{int(u[1, 7] * 31)}",
         "status": status,
     }
 
-
-def simulate_network() -> dict:
-    rng = random.Random(int(datetime.now(timezone.utc).timestamp() // 3) + 42)
-    rtt = clamp(rng.uniform(12, 180) * (3.0 if rng.random() < 0.05 else 1.0), 1, 2000)
-    loss = clamp(rng.uniform(0.0, 1.2) * (5.0 if rng.random() < 0.03 else 1.0), 0, 30)
-    dns = clamp(rng.uniform(8, 90) * (2.6 if rng.random() < 0.05 else 1.0), 1, 1200)
     status = "ok"
     if rtt > 220 or loss > 1.5 or dns > 140:
         status = "warn"
     if rtt > 480 or loss > 5.0:
         status = "down"
-    return {
-        "ts": iso_now(),
+    network = {
+        "ts": now,
         "rtt_ms": rtt,
         "packet_loss_percent": loss,
         "dns_ms": dns,
         "status": status,
     }
 
-
-def simulate_cloud() -> dict:
-    rng = random.Random(int(datetime.now(timezone.utc).timestamp() // 5) + 777)
-    total = rng.randint(6, 14)
-    unhealthy = 0
-    for _ in range(total):
-        if rng.random() < 0.12:
-            unhealthy += 1
+    c = draws[3]
+    total = 6 + int(c[0] * 9)
+    unhealthy = rng.binomial(total, 0.12)
     healthy = total - unhealthy
-    cost = clamp(rng.uniform(120, 680) + unhealthy * rng.uniform(10, 40), 20, 5000)
-    incidents = unhealthy + (1 if rng.random() < 0.08 else 0)
+    cost_base, cost_per_unhealthy, incident = c[1:4].tolist()
+    cost = 120 + cost_base * 560 + unhealthy * (10 + cost_per_unhealthy * 30)
+    cost = 20.0 if cost < 20 else (5000.0 if cost > 5000 else cost)
+    incidents = unhealthy + (1 if incident < 0.08 else 0)
 
     status = "ok"
     if unhealthy >= 1 or incidents >= 1:
         status = "warn"
     if unhealthy >= 3 or incidents >= 4:
         status = "down"
-
-    return {
-        "ts": iso_now(),
+    cloud = {
+        "ts": now,
         "total_count": total,
         "healthy_count": healthy,
         "estimated_cost_per_day_usd": cost,
@@ -233,66 +333,137 @@ def simulate_cloud() -> dict:
         "status": status,
     }
 
+    return {"system": system, "app": app_status, "network": network, "cloud": cloud}
 
-def simulate_security() -> dict:
-    rng = random.Random(int(datetime.now(timezone.utc).timestamp() // 7) + 2024)
-    # emit 2-5 events, random selection
-    count = rng.randint(2, 5)
-    chosen = rng.sample(SECURITY_EVENTS, k=count)
+
+def simulate_security(now: datetime) -> dict:
+    rng = np.random.default_rng(int(now.timestamp() // 7) + 2024)
+    # emit 2-5 events, random selection (capped by how many events we know about)
+    count = int(rng.integers(2, min(5, len(_SECURITY_ROWS)) + 1))
+    chosen = rng.choice(len(_SECURITY_ROWS), size=count, replace=False).tolist()
+    minutes_ago = rng.integers(0, 91, size=count).tolist()
 
     # stamp timestamps near now
     out = []
-    for ev in chosen:
-        minutes_ago = rng.randint(0, 90)
-        ts = (datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)).isoformat()
-        out.append({**ev, "ts": ts, "source": "backend"})
+    max_rank = 0
+    for i, minutes in zip(chosen, minutes_ago):
+        ev_id, severity, title, detail, rank = _SECURITY_ROWS[i]
+        out.append({
+            "id": ev_id,
+            "severity": severity,
+            "title": title,
+            "detail": detail,
+            "ts": now - timedelta(minutes=minutes),
+            "source": "backend",
+        })
+        if rank > max_rank:
+            max_rank = rank
 
     # status derived from highest severity
-    sev_rank = {"info": 0, "medium": 1, "high": 2, "critical": 3}
-    max_rank = max(sev_rank.get(e["severity"], 0) for e in out)
     status = "ok"
     if max_rank >= 1:
         status = "warn"
     if max_rank >= 3:
         status = "down"
 
-    return {"ts": iso_now(), "status": status, "events": out}
+    return {"ts": now, "status": status, "events": out}
+
+
+# -----------------------------
+# Cached payloads (periods match each simulator's seed bucket)
+# -----------------------------
+def encode_domains(now: datetime) -> dict[str, dict[str, bytes]]:
+    return {name: precompress(encode(payload)) for name, payload in simulate_domains(now).items()}
+
+
+def encode_security(now: datetime) -> dict[str, bytes]:
+    return precompress(encode(simulate_security(now)))
+
+
+@lru_cache(maxsize=512)
+def encode_service_metrics(service_id: str, bucket: int) -> dict[str, bytes]:
+    # Keyed by arbitrary client ids, so bounded by LRU; ts is the bucket start
+    # so the cached bytes are the same no matter which request filled them.
+    now = datetime.fromtimestamp(bucket * 5, timezone.utc)
+    return precompress(encode(simulate_service_metrics(service_id, now)))
+
+
+domain_payloads = bucket_cached(3, encode_domains)
+security_payload = bucket_cached(7, encode_security)
 
 
 # -----------------------------
 # API endpoints (unique handlers per domain)
 # -----------------------------
 @app.get("/api/system")
-def get_system_status():
-    return simulate_system()
+async def get_system_status(request: Request):
+    return encoded_response(domain_payloads()["system"], request)
 
 
 @app.get("/api/app")
-def get_app_status():
-    return simulate_app()
+async def get_app_status(request: Request):
+    return encoded_response(domain_payloads()["app"], request)
 
 
 @app.get("/api/network")
-def get_network_status():
-    return simulate_network()
+async def get_network_status(request: Request):
+    return encoded_response(domain_payloads()["network"], request)
 
 
 @app.get("/api/cloud")
-def get_cloud_status():
-    return simulate_cloud()
+async def get_cloud_status(request: Request):
+    return encoded_response(domain_payloads()["cloud"], request)
 
 
 @app.get("/api/security")
-def get_security_events():
-    return simulate_security()
+async def get_security_events(request: Request):
+    return encoded_response(security_payload(), request)
 
 
-@app.get("/api/services", response_model=ServicesResponse)
-def list_services():
-    return {"ts": iso_now(), "services": BASE_SERVICES}
+@app.get("/api/services", responses={200: {"model": ServicesResponse}})
+async def list_services(request: Request):
+    # Dashboards poll this; the list is static, so let them skip the body entirely
+    if etag_matches(request.headers.get("if-none-match"), _SERVICES_ETAG):
+        return Response(status_code=304, headers={**_CORS, "ETag": _SERVICES_ETAG})
 
+    ts = encode(datetime.now(timezone.utc))
+    body = b'{"ts":' + ts + b',"services":[' + _SERVICES_BLOB + b"]}"
+    return Response(content=body, media_type="application/json", headers={**_CORS, "ETag": _SERVICES_ETAG})
 
-@app.get("/api/services/{service_id}/metrics", response_model=ServiceMetrics)
-def get_service_metrics(service_id: str):
+
+@app.get("/api/services/{service_id}/metrics", responses={200: {"model": ServiceMetrics}})
+async def get_service_metrics(service_id: str, request: Request):
     # Works for base services AND any local ids from the frontend
-    return simulate_service_metrics(service_id)
+    return encoded_response(encode_service_metrics(service_id, int(time.time()) // 5), request)
+
+
+# -----------------------------
+# CORS for everything the handlers above don't build themselves
+# -----------------------------
+@app.exception_handler(StarletteHTTPException)
+async def cors_http_exception_handler(request: Request, exc: StarletteHTTPException) -> Response:
+    # framework 404/405s (and any HTTPException) bypass the pre-baked headers
+    response = await http_exception_handler(request, exc)
+    response.headers.update(_CORS)
+    return response
+
+
+@app.exception_handler(RequestValidationError)
+async def cors_validation_exception_handler(request: Request, exc: RequestValidationError) -> Response:
+    response = await request_validation_exception_handler(request, exc)
+    response.headers.update(_CORS)
+    return response
+
+
+async def cors_preflight():
+    return Response(status_code=204, headers={**_CORS, "Access-Control-Max-Age": "600"})
+
+
+def _add_preflights(app: FastAPI) -> None:
+    # Answer preflights only on real routes, so unknown paths still 404
+    for route in [r for r in app.routes if isinstance(r, APIRoute)]:
+        app.add_api_route(route.path, cors_preflight, methods=["OPTIONS"], include_in_schema=False)
+
+
+# Must stay last: only routes registered above this call get a preflight handler.
+_add_preflights(app)
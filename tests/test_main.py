@@ -0,0 +1,228 @@
+import gzip
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import brotli
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import _CORS, app
+
+client = TestClient(app)
+
+FROZEN = 1_790_000_000.0
+
+
+@pytest.fixture
+def frozen_time(monkeypatch):
+    # pin the cache buckets so repeated requests see the same payload
+    monkeypatch.setattr(main, "time", SimpleNamespace(time=lambda: FROZEN))
+
+
+def test_unknown_path_is_not_found():
+    for path in ("/nope", "/api/nope"):
+        response = client.get(path)
+        assert response.status_code == 404
+        for key, value in _CORS.items():
+            assert response.headers[key] == value
+
+
+def test_wrong_method_keeps_cors_headers():
+    response = client.post("/api/system")
+    assert response.status_code == 405
+    assert response.headers["access-control-allow-origin"] == "*"
+
+
+def test_preflight_on_real_routes():
+    for path in ("/api/system", "/api/services/svc-auth/metrics"):
+        response = client.options(path, headers={"Origin": "http://example.com", "Access-Control-Request-Method": "GET"})
+        assert response.status_code == 204
+        for key, value in _CORS.items():
+            assert response.headers[key] == value
+
+
+# -----------------------------
+# Content negotiation
+# -----------------------------
+def fetch_raw(path, accept_encoding):
+    # httpx would transparently decode, so read the wire bytes instead
+    with client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+
+def decode(body, coding):
+    if coding == "br":
+        return brotli.decompress(body)
+    if coding == "gzip":
+        return gzip.decompress(body)
+    return body
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "expected"),
+    [
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("br", "br"),
+        ("gzip, br", "br"),
+        ("gzip;q=0.5, br;q=0.1", "gzip"),
+        ("br;q=0, *", "gzip"),
+        ("br;q=0, gzip;q=0, *", None),
+        ("*;q=0", None),
+        ("*", "br"),
+        ("GZIP", "gzip"),
+        ("br ; Q=0 , gzip ; q = 0.8", "gzip"),
+        ("br;q=oops, gzip", "gzip"),
+    ],
+)
+def test_negotiates_precompressed_body(frozen_time, accept_encoding, expected):
+    _, identity = fetch_raw("/api/security", "identity")
+    response, body = fetch_raw("/api/security", accept_encoding)
+
+    assert response.status_code == 200
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers.get("content-encoding") == expected
+    assert decode(body, expected) == identity
+
+
+# -----------------------------
+# /api/services ETag
+# -----------------------------
+def test_services_etag_round_trip():
+    first = client.get("/api/services")
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+
+    response = client.get("/api/services", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    for key, value in _CORS.items():
+        assert response.headers[key] == value
+
+
+@pytest.mark.parametrize(
+    "if_none_match",
+    [
+        main._SERVICES_ETAG.removeprefix("W/"),
+        '"other", ' + main._SERVICES_ETAG,
+        "*",
+    ],
+)
+def test_services_etag_matches(if_none_match):
+    assert client.get("/api/services", headers={"If-None-Match": if_none_match}).status_code == 304
+
+
+def test_services_wrong_etag_sends_body():
+    response = client.get("/api/services", headers={"If-None-Match": '"nope"'})
+    assert response.status_code == 200
+    assert response.json()["services"] == main.BASE_SERVICES
+
+
+# -----------------------------
+# Cached simulator payloads
+# -----------------------------
+def test_cached_ts_is_bucket_start(frozen_time):
+    for path, period in (("/api/system", 3), ("/api/security", 7), ("/api/services/svc-auth/metrics", 5)):
+        ts = client.get(path).json()["ts"]
+        start = int(FROZEN) // period * period
+        assert ts == datetime.fromtimestamp(start, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def expected_status(warn, down):
+    return "down" if down else ("warn" if warn else "ok")
+
+
+def test_simulate_domains_ranges_and_status():
+    for bucket in range(2000):
+        now = datetime.fromtimestamp(bucket * 3, timezone.utc)
+        domains = main.simulate_domains(now)
+        assert domains == main.simulate_domains(now)
+
+        s = domains["system"]
+        assert 1 <= s["cpu_percent"] <= 100
+        # mem/disk never spike, so they stay inside their draw range
+        assert 30 <= s["mem_percent"] <= 88
+        assert 40 <= s["disk_percent"] <= 93
+        assert 12 <= int(s["uptime_human"].removesuffix("h")) <= 240
+        assert s["status"] == expected_status(
+            s["cpu_percent"] > 90 or s["mem_percent"] > 90 or s["disk_percent"] > 92,
+            s["cpu_percent"] > 96 or s["mem_percent"] > 96,
+        )
+
+        a = domains["app"]
+        assert 10 <= a["p95_latency_ms"] <= 3000
+        assert 20 <= a["rps"] <= 520
+        assert 0 <= a["error_rate_percent"] <= 30
+        minor, patch = map(int, a["version"].removeprefix("v1.").split("."))
+        assert 2 <= minor <= 9 and 0 <= patch <= 30
+        assert a["status"] == expected_status(
+            a["p95_latency_ms"] > 900 or a["error_rate_percent"] > 3.5,
+            a["p95_latency_ms"] > 1400 or a["error_rate_percent"] > 8,
+        )
+
+        n = domains["network"]
+        assert 1 <= n["rtt_ms"] <= 2000
+        assert 0 <= n["packet_loss_percent"] <= 30
+        assert 1 <= n["dns_ms"] <= 1200
+        assert n["status"] == expected_status(
+            n["rtt_ms"] > 220 or n["packet_loss_percent"] > 1.5 or n["dns_ms"] > 140,
+            n["rtt_ms"] > 480 or n["packet_loss_percent"] > 5.0,
+        )
+
+        c = domains["cloud"]
+        assert 6 <= c["total_count"] <= 14
+        assert 0 <= c["healthy_count"] <= c["total_count"]
+        assert 20 <= c["estimated_cost_per_day_usd"] <= 5000
+        unhealthy = c["total_count"] - c["healthy_count"]
+        assert unhealthy <= c["open_incidents"] <= unhealthy + 1
+        assert c["status"] == expected_status(
+            unhealthy >= 1 or c["open_incidents"] >= 1,
+            unhealthy >= 3 or c["open_incidents"] >= 4,
+        )
+
+
+def clamp(v, lo, hi):
+    return max(lo, min(hi, v))
+
+
+def test_simulate_domains_matches_scalar_reference():
+    # Recompute each metric one at a time from the same draws, so a transposed
+    # cell in the _METRIC_* / _SPIKE_* tables shows up as a mismatch.
+    for bucket in range(500):
+        now = datetime.fromtimestamp(bucket * 3, timezone.utc)
+        domains = main.simulate_domains(now)
+        u = np.random.default_rng(bucket).random((4, 8))
+
+        s, a, n = u[0], u[1], u[2]
+        assert domains["system"]["cpu_percent"] == pytest.approx(clamp(18 + s[0] * 74 + (10 if s[3] < 0.12 else 0), 1, 100))
+        assert domains["system"]["mem_percent"] == pytest.approx(clamp(30 + s[1] * 58, 1, 100))
+        assert domains["system"]["disk_percent"] == pytest.approx(clamp(40 + s[2] * 53, 1, 100))
+
+        assert domains["app"]["p95_latency_ms"] == pytest.approx(clamp((90 + a[0] * 760) * (3.2 if a[3] < 0.06 else 1.0), 10, 3000))
+        assert domains["app"]["rps"] == pytest.approx(clamp(20 + a[1] * 500, 1, 5000))
+        assert domains["app"]["error_rate_percent"] == pytest.approx(clamp((0.05 + a[2] * 3.45) * (4.0 if a[5] < 0.05 else 1.0), 0, 30))
+
+        assert domains["network"]["rtt_ms"] == pytest.approx(clamp((12 + n[0] * 168) * (3.0 if n[3] < 0.05 else 1.0), 1, 2000))
+        assert domains["network"]["packet_loss_percent"] == pytest.approx(clamp(n[1] * 1.2 * (5.0 if n[4] < 0.03 else 1.0), 0, 30))
+        assert domains["network"]["dns_ms"] == pytest.approx(clamp((8 + n[2] * 82) * (2.6 if n[5] < 0.05 else 1.0), 1, 1200))
+
+
+# -----------------------------
+# Service metrics
+# -----------------------------
+def test_stable_seed_is_fixed_across_processes():
+    # blake2s, not the per-process salted hash(): this constant must never change
+    assert main.stable_seed("svc-auth") == 7621988302577345956
+
+
+def test_service_metrics_bytes_are_deterministic():
+    first = main.encode_service_metrics("svc-auth", 358_000_000)
+    main.encode_service_metrics.cache_clear()
+    second = main.encode_service_metrics("svc-auth", 358_000_000)
+    assert first is not second
+    assert first == second
+    assert main.encode_service_metrics("svc-orders", 358_000_000) != first